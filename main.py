@@ -1,16 +1,34 @@
 import os
+import re
 import csv
 import json
 import hashlib
+import shutil
 import argparse
 import datetime
+import functools
+import operator
+import importlib.util
+import dataclasses
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import random
-from io import StringIO
-from typing import Dict, List, Optional, Any, Union, Tuple
+from io import BufferedReader, TextIOWrapper
+from typing import BinaryIO, Collection, Dict, List, Optional, Any, Union, Tuple
 from dotenv import load_dotenv
 
+# Optional CSV engines (polars, pyarrow) are imported on first use by load_csv_engine.
+# Only the selected one is loaded, as the two libraries' thread pools can clash on exit
+pl = None
+pa = pc = pacsv = None
+
+try:
+    import orjson
+except ImportError:
+    # orjson is optional - fall back to the stdlib json module when it's missing
+    orjson = None
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -30,10 +48,86 @@ class Trading212Action:
     CARD_CREDIT = "Card credit"
     SPENDING_CASHBACK = "Spending cashback"
 
+@dataclasses.dataclass(slots=True)
+class Trading212Transaction:
+    """A single row of a Trading 212 export, with the total parsed to milliunits"""
+    action: str
+    timestamp: str
+    isin: str
+    ticker: str
+    name: str
+    shareCount: str
+    pricePerShare: str
+    pricePerShareCurrency: str
+    exchangeRate: str
+    result: str
+    resultCurrency: str
+    total: int
+    totalCurrency: str
+    withholdingTax: str
+    withholdingTaxCurrency: str
+    notes: str
+    id: str
+    # Currency conversion details
+    conversionFromAmount: str
+    conversionFromCurrency: str
+    conversionToAmount: str
+    conversionToCurrency: str
+    conversionFee: str
+    conversionFeeCurrency: str
+    # Merchant details for card transactions
+    merchantName: str
+    merchantCategory: str
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the transaction to a dict keyed by field name"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
 # Constants
 IMPORT_ID_VERSION = 15  # Increment this to generate new import IDs
 IMPORT_PREFIX = "T212-"
 VERSIONED_IMPORT_PREFIX = f"{IMPORT_PREFIX}v{IMPORT_ID_VERSION}:"
+MAX_BACKOFF = 30  # Upper limit in seconds for the backoff between failed request retries
+MAX_RETRY_AFTER = 120  # Upper limit in seconds for honouring a 429 Retry-After header
+
+# Anything that isn't part of a number (currency symbols, thousands separators, spaces)
+MONEY_CLEAN_PATTERN = r"[^\d.\-]"
+# Splits a cleaned amount into units and decimals at the last decimal point
+MONEY_PATTERN = r"^(?P<units>.*?)(?:\.(?P<cents>[^.]*))?$"
+_MONEY_CLEAN_RE = re.compile(MONEY_CLEAN_PATTERN)
+
+# Mapping of Trading212Transaction fields (in order) to the Trading 212 CSV column names
+CSV_COLUMNS = {
+    "action": "Action",
+    "timestamp": "Time",
+    "isin": "ISIN",
+    "ticker": "Ticker",
+    "name": "Name",
+    "shareCount": "No. of shares",
+    "pricePerShare": "Price / share",
+    "pricePerShareCurrency": "Currency (Price / share)",
+    "exchangeRate": "Exchange rate",
+    "result": "Result",
+    "resultCurrency": "Currency (Result)",
+    "total": "Total",
+    "totalCurrency": "Currency (Total)",
+    "withholdingTax": "Withholding tax",
+    "withholdingTaxCurrency": "Currency (Withholding tax)",
+    "notes": "Notes",
+    "id": "ID",
+    # Currency conversion details
+    "conversionFromAmount": "Currency conversion from amount",
+    "conversionFromCurrency": "Currency (Currency conversion from amount)",
+    "conversionToAmount": "Currency conversion to amount",
+    "conversionToCurrency": "Currency (Currency conversion to amount)",
+    "conversionFee": "Currency conversion fee",
+    "conversionFeeCurrency": "Currency (Currency conversion fee)",
+    # Merchant details for card transactions
+    "merchantName": "Merchant name",
+    "merchantCategory": "Merchant category",
+}
+# Position of the total among the Trading212Transaction fields
+TOTAL_FIELD_INDEX = list(CSV_COLUMNS).index("total")
 
 def parse_money(amount: str) -> int:
     """
@@ -51,7 +145,7 @@ def parse_money(amount: str) -> int:
     
     try:
         # Remove currency symbols and commas
-        clean_amount = ''.join(c for c in amount if c.isdigit() or c in '.-')
+        clean_amount = _MONEY_CLEAN_RE.sub('', amount)
         if '.' in clean_amount:
             # Split dollars and cents
             dollars, cents = clean_amount.rsplit('.', 1)
@@ -67,6 +161,23 @@ def parse_money(amount: str) -> int:
     except ValueError:
         return 0
 
+def parse_money_expr(column: "pl.Expr") -> "pl.Expr":
+    """
+    Vectorised version of parse_money for a polars string column.
+
+    Args:
+        column (pl.Expr): Expression for the column holding monetary values as strings.
+
+    Returns:
+        pl.Expr: Expression for the monetary values in milliunits (0 where unparseable).
+    """
+    parts = column.str.replace_all(MONEY_CLEAN_PATTERN, "").str.extract_groups(MONEY_PATTERN)
+    units = parts.struct.field("units")
+    # Pad cents with zeros and convert to milliunits, negating them for negative amounts
+    cents = parts.struct.field("cents").fill_null("").str.pad_end(2, "0").str.slice(0, 2).cast(pl.Int64, strict=False) * 10
+    cents = pl.when(units.str.starts_with("-")).then(-cents).otherwise(cents)
+    return (units.cast(pl.Int64, strict=False) * 1000 + cents).fill_null(0)
+
 def create_import_id(data: str) -> str:
     """Create import ID with hash of data"""
     hash_obj = hashlib.sha256(data.encode())
@@ -85,6 +196,17 @@ class Trading212API:
         "POST /history/exports": (1, 30),   # 1 request per 30 seconds
     }
     
+    # Data requested in every export
+    EXPORT_DATA_INCLUDED = {
+        "includeDividends": True,
+        "includeInterest": True, 
+        "includeOrders": True,
+        "includeTransactions": True
+    }
+    
+    # How stale a finished export's end time may be for it to be reused
+    EXPORT_REUSE_WINDOW = datetime.timedelta(minutes=15)
+    
     def __init__(self, api_token: str, use_demo: bool = False):
         self.api_token = api_token
         self.base_url = self.BASE_URL_DEMO if use_demo else self.BASE_URL_LIVE
@@ -94,6 +216,11 @@ class Trading212API:
         }
         # Track last request time for rate limiting
         self.last_request_times = {}
+        # Reuse connections across the export request, status polls and download.
+        # Headers are passed per API request so the token isn't sent to the download host
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=0)
+        self.session.mount("https://", adapter)
     
     def _make_request(self, method: str, endpoint: str, **kwargs) -> requests.Response:
         """
@@ -120,14 +247,17 @@ class Trading212API:
         
         for retry in range(max_retries):
             try:
-                response = requests.request(method, url, headers=self.headers, **kwargs)
+                response = self.session.request(method, url, headers=self.headers, **kwargs)
                 
                 # Record the time of this request
                 self.last_request_times[rate_limit_key] = time.time()
                 
                 # Handle rate limiting
                 if response.status_code == 429:
-                    retry_after = int(response.headers.get('Retry-After', base_delay * (2 ** retry)))
+                    # Follow Retry-After, capped separately so it never falls short of the endpoint's rate limit
+                    _, period_seconds = self.RATE_LIMITS.get(rate_limit_key, (None, 0))
+                    max_wait = max(MAX_RETRY_AFTER, period_seconds + 1)
+                    retry_after = min(int(response.headers.get('Retry-After', base_delay * (2 ** retry))), max_wait)
                     print(f"Rate limited. Waiting {retry_after} seconds before retry...")
                     time.sleep(retry_after)
                     continue
@@ -140,8 +270,8 @@ class Trading212API:
                 if retry == max_retries - 1:
                     raise
                 
-                # Calculate backoff time with jitter
-                delay = base_delay * (2 ** retry) + random.uniform(0, 1)
+                # Calculate capped backoff time with jitter
+                delay = min(MAX_BACKOFF, base_delay * (2 ** retry)) + random.uniform(0, base_delay)
                 print(f"Request failed: {e}. Retrying in {delay:.1f} seconds...")
                 time.sleep(delay)
         
@@ -152,12 +282,7 @@ class Trading212API:
         """Request a new export of transaction data"""
         endpoint = "/history/exports"
         payload = {
-            "dataIncluded": {
-                "includeDividends": True,
-                "includeInterest": True, 
-                "includeOrders": True,
-                "includeTransactions": True
-            },
+            "dataIncluded": self.EXPORT_DATA_INCLUDED,
             "timeFrom": from_date,
             "timeTo": to_date
         }
@@ -171,12 +296,100 @@ class Trading212API:
         response = self._make_request("GET", endpoint)
         return response.json()
     
-    def download_csv(self, download_link: str) -> str:
-        """Download the CSV content from a link"""
+    def find_recent_export(self, from_date: datetime.datetime, to_date: datetime.datetime) -> Optional[str]:
+        """
+        Find a finished export covering the same date range, returning its download link
+        """
+        for export in self.get_exports():
+            if export.get("status") != "Finished" or not export.get("downloadLink"):
+                continue
+            if export.get("dataIncluded") != self.EXPORT_DATA_INCLUDED:
+                continue
+            
+            try:
+                time_from = datetime.datetime.fromisoformat(export["timeFrom"])
+                time_to = datetime.datetime.fromisoformat(export["timeTo"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            # Treat timestamps without an offset as UTC
+            if time_from.tzinfo is None:
+                time_from = time_from.replace(tzinfo=datetime.UTC)
+            if time_to.tzinfo is None:
+                time_to = time_to.replace(tzinfo=datetime.UTC)
+            
+            if time_from == from_date and to_date - time_to <= self.EXPORT_REUSE_WINDOW:
+                return export["downloadLink"]
+        
+        return None
+    
+    def wait_for_export(self, report_id: int, max_attempts: int = 30) -> str:
+        """Poll until an export has finished, returning its download link"""
+        for attempt in range(max_attempts):
+            print(f"Checking export status (attempt {attempt+1}/{max_attempts})...")
+            
+            exports = self.get_exports()
+            export = next((e for e in exports if e.get("reportId") == report_id), None)
+            
+            if not export:
+                raise ValueError(f"Could not find export with reportId {report_id}")
+            
+            status = export.get("status")
+            print(f"Export status: {status}")
+            
+            if status == "Finished":
+                download_link = export.get("downloadLink")
+                if download_link:
+                    return download_link
+            elif status == "Failed":
+                raise ValueError("Export failed on Trading 212 server")
+            
+            # No extra sleep needed: the next get_exports() call waits out the rate limit
+        
+        raise TimeoutError("Export did not complete within the expected time")
+    
+    def download_csv(self, download_link: str) -> BinaryIO:
+        """Open a streaming download of the CSV content from a link"""
         # Direct download doesn't go through the API, so no need for rate limiting
-        response = requests.get(download_link)
+        response = self.session.get(download_link, stream=True)
         response.raise_for_status()
-        return response.text
+        # Undo any gzip/deflate transfer encoding as the stream is read, and keep the
+        # stream open at EOF so it can be wrapped by io.TextIOWrapper
+        response.raw.decode_content = True
+        response.raw.auto_close = False
+        return response.raw
+
+def load_csv_engine(engine: str) -> str:
+    """
+    Import the library behind a CSV engine.
+    
+    Args:
+        engine (str): "polars", "pyarrow", "csv", or "auto" for polars when it's installed.
+        
+    Returns:
+        str: The name of the engine to parse with.
+    """
+    global pl, pa, pc, pacsv
+    
+    if engine == "auto":
+        # polars is optional - fall back to the stdlib csv module when it's missing
+        engine = "polars" if importlib.util.find_spec("polars") is not None else "csv"
+    
+    if engine == "polars":
+        try:
+            import polars as pl
+        except ImportError:
+            raise ValueError("The polars engine requires polars (pip install polars)")
+    elif engine == "pyarrow":
+        try:
+            import pyarrow as pa
+            import pyarrow.compute as pc
+            from pyarrow import csv as pacsv
+        except ImportError:
+            raise ValueError("The pyarrow engine requires pyarrow (pip install pyarrow)")
+    elif engine != "csv":
+        raise ValueError(f"Unknown CSV engine: {engine}")
+    
+    return engine
 
 def get_trading212_transactions(
     csv_path: Optional[str] = None, 
@@ -184,8 +397,11 @@ def get_trading212_transactions(
     use_demo: bool = False,
     days: Optional[int] = None,
     start_date: Optional[str] = None,
-    save_raw_csv: Optional[str] = None
-) -> List[Dict[str, Any]]:
+    save_raw_csv: Optional[str] = None,
+    filter_actions: Optional[Collection[str]] = None,
+    engine: str = "auto",
+    reuse_recent_export: bool = False
+) -> List[Trading212Transaction]:
     """
     Get Trading 212 transactions either from a local CSV file or by fetching from the API
     
@@ -196,13 +412,18 @@ def get_trading212_transactions(
         days: Number of days in the past to fetch transactions for
         start_date: Start date in DD/MM/YYYY format
         save_raw_csv: Path to save the raw CSV content before processing
+        filter_actions: Only return transactions with these action types
+        engine: CSV parser to use - "polars", "pyarrow", "csv", or "auto" for polars when installed
+        reuse_recent_export: Download a recent finished export of the same date range if there is one
     """
-    csv_content = None
+    # Load the CSV engine up front so a missing dependency is reported before fetching
+    engine = load_csv_engine(engine)
+    
+    csv_file = None
     
     # If CSV path is provided, read from the file
     if csv_path:
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            csv_content = f.read()
+        csv_file = open(csv_path, 'rb')
     
     # Otherwise, fetch from Trading 212 API
     elif api_token:
@@ -248,99 +469,164 @@ def get_trading212_transactions(
         
         print(f"Fetching transactions from {from_date.strftime('%d/%m/%Y')} to {today.strftime('%d/%m/%Y')}")
         
-        print("Requesting new export from Trading 212...")
-        export_request = api.request_export(
-            from_date.isoformat(), 
-            today.isoformat()
-        )
-        report_id = export_request.get("reportId")
-        
-        if not report_id:
-            raise ValueError("Failed to get reportId from export request")
-        
-        # Poll for export completion
-        max_attempts = 30
-        for attempt in range(max_attempts):
-            print(f"Checking export status (attempt {attempt+1}/{max_attempts})...")
-            
-            exports = api.get_exports()
-            export = next((e for e in exports if e.get("reportId") == report_id), None)
-            
-            if not export:
-                raise ValueError(f"Could not find export with reportId {report_id}")
-            
-            status = export.get("status")
-            print(f"Export status: {status}")
+        # Optionally reuse a recent export of the same date range rather than waiting for a new one.
+        # This costs a GET, so if none is found the first status check waits out the rate limit
+        download_link = api.find_recent_export(from_date, today) if reuse_recent_export else None
+        if download_link:
+            print("Found a recent export of the same date range")
+        else:
+            print("Requesting new export from Trading 212...")
+            export_request = api.request_export(
+                from_date.isoformat(), 
+                today.isoformat()
+            )
+            report_id = export_request.get("reportId")
             
-            if status == "Finished":
-                download_link = export.get("downloadLink")
-                if download_link:
-                    print("Export ready. Downloading...")
-                    csv_content = api.download_csv(download_link)
-                    break
-            elif status == "Failed":
-                raise ValueError("Export failed on Trading 212 server")
+            if not report_id:
+                raise ValueError("Failed to get reportId from export request")
             
-            # Wait before trying again - use a longer wait time to avoid rate limits
-            wait_time = 15 + random.uniform(0, 5)
-            print(f"Waiting {wait_time:.1f} seconds before checking again...")
-            time.sleep(wait_time)
+            # Poll for export completion
+            download_link = api.wait_for_export(report_id)
         
-        if not csv_content:
-            raise TimeoutError("Export did not complete within the expected time")
+        print("Export ready. Downloading...")
+        csv_file = api.download_csv(download_link)
     
     else:
         raise ValueError("Either csv_path or api_token must be provided")
     
-    # Save raw CSV content if requested
-    if save_raw_csv and csv_content:
-        with open(save_raw_csv, 'w', encoding='utf-8') as f:
-            f.write(csv_content)
-        print(f"Saved raw CSV content to {save_raw_csv}")
+    try:
+        # Save raw CSV content if requested, then parse the saved copy.
+        # Opening the input file itself for writing would truncate it before it's copied
+        if save_raw_csv and csv_path and os.path.exists(save_raw_csv) and os.path.samefile(csv_path, save_raw_csv):
+            print(f"Raw CSV content is already saved at {save_raw_csv}")
+        elif save_raw_csv:
+            with open(save_raw_csv, 'wb') as f:
+                shutil.copyfileobj(csv_file, f)
+            print(f"Saved raw CSV content to {save_raw_csv}")
+            csv_file.close()
+            csv_file = open(save_raw_csv, 'rb')
+        
+        # Parse the CSV content with the selected engine
+        return CSV_READERS[engine](csv_file, filter_actions)
+    finally:
+        csv_file.close()
+
+def _read_transactions_polars(csv_file: BinaryIO, filter_actions: Optional[Collection[str]] = None) -> List[Trading212Transaction]:
+    """Parse CSV content into transactions in a single columnar pass with polars"""
+    try:
+        # Read every column as a string, ignoring any fields beyond the header like the csv engine
+        df = pl.read_csv(csv_file, has_header=True, infer_schema_length=0, truncate_ragged_lines=True)
+    except pl.exceptions.NoDataError:
+        return []
+    
+    # Blank lines come back as all-null rows - skip them like the other engines do
+    df = df.filter(~pl.all_horizontal(pl.all().is_null()))
+    
+    columns = []
+    for key, column in CSV_COLUMNS.items():
+        # Columns missing from the export become empty strings, like row.get(column, "")
+        expr = pl.col(column) if column in df.columns else pl.lit(None, dtype=pl.Utf8)
+        if key == "total":
+            expr = parse_money_expr(expr)
+        else:
+            expr = expr.fill_null("")
+        columns.append(expr.alias(key))
+    
+    query = df.lazy().select(columns)
+    if filter_actions is not None:
+        # Filter before converting to transactions so only matching rows are materialized
+        query = query.filter(pl.col("action").is_in(list(filter_actions)))
     
-    # Parse the CSV content
-    reader = csv.DictReader(StringIO(csv_content))
+    return [Trading212Transaction(*row) for row in query.collect().iter_rows()]
+
+def _read_transactions_csv(csv_file: BinaryIO, filter_actions: Optional[Collection[str]] = None) -> List[Trading212Transaction]:
+    """Parse CSV content into transactions row by row with the stdlib csv module"""
+    reader = csv.reader(TextIOWrapper(csv_file, encoding='utf-8', newline=''))
+    header = next(reader, None)
+    if header is None:
+        return []
+    
+    # Resolve column positions once instead of looking fields up by name on every row.
+    # Columns missing from the export point at an empty field appended to each row
+    positions = {column: i for i, column in enumerate(header)}
+    width = len(header)
+    get_fields = operator.itemgetter(*(positions.get(column, -1) for column in CSV_COLUMNS.values()))
+    action_index = positions.get(CSV_COLUMNS["action"], -1)
     transactions = []
     
     for row in reader:
+        # Skip blank lines, like csv.DictReader
+        if not row:
+            continue
+        # Pad short rows so their missing fields read as empty
+        if len(row) < width:
+            row.extend([""] * (width - len(row)))
+        row.append("")
+        
+        # Skip filtered out rows before building the transaction
+        if filter_actions is not None and row[action_index] not in filter_actions:
+            continue
+        
         # Convert CSV row to our transaction format
-        transaction = {
-            "action": row.get("Action", ""),
-            "timestamp": row.get("Time", ""),
-            "isin": row.get("ISIN", ""),
-            "ticker": row.get("Ticker", ""),
-            "name": row.get("Name", ""),
-            "shareCount": row.get("No. of shares", ""),
-            "pricePerShare": row.get("Price / share", ""),
-            "pricePerShareCurrency": row.get("Currency (Price / share)", ""),
-            "exchangeRate": row.get("Exchange rate", ""),
-            "result": row.get("Result", ""),
-            "resultCurrency": row.get("Currency (Result)", ""),
-            "total": parse_money(row.get("Total", "0")),
-            "totalCurrency": row.get("Currency (Total)", ""),
-            "withholdingTax": row.get("Withholding tax", ""),
-            "withholdingTaxCurrency": row.get("Currency (Withholding tax)", ""),
-            "notes": row.get("Notes", ""),
-            "id": row.get("ID", ""),
-            # Currency conversion details
-            "conversionFromAmount": row.get("Currency conversion from amount", ""),
-            "conversionFromCurrency": row.get("Currency (Currency conversion from amount)", ""),
-            "conversionToAmount": row.get("Currency conversion to amount", ""),
-            "conversionToCurrency": row.get("Currency (Currency conversion to amount)", ""),
-            "conversionFee": row.get("Currency conversion fee", ""),
-            "conversionFeeCurrency": row.get("Currency (Currency conversion fee)", ""),
-            # Merchant details for card transactions
-            "merchantName": row.get("Merchant name", ""),
-            "merchantCategory": row.get("Merchant category", "")
-        }
-        transactions.append(transaction)
+        fields = list(get_fields(row))
+        fields[TOTAL_FIELD_INDEX] = parse_money(fields[TOTAL_FIELD_INDEX])
+        transactions.append(Trading212Transaction(*fields))
     
     return transactions
 
-def filter_transactions(transactions: List[Dict[str, Any]], selected_types: List[str]) -> List[Dict[str, Any]]:
+def _read_transactions_pyarrow(csv_file: BinaryIO, filter_actions: Optional[Collection[str]] = None) -> List[Trading212Transaction]:
+    """
+    Parse CSV content into transactions with pyarrow's multi-threaded block reader.
+    
+    Unlike the other engines, rows with fewer or more fields than the header are
+    rejected with pyarrow.ArrowInvalid rather than padded or truncated.
+    """
+    # pyarrow can't read an empty file, so check for one without consuming the stream
+    if not isinstance(csv_file, BufferedReader):
+        csv_file = BufferedReader(csv_file)
+    if not csv_file.peek(1):
+        return []
+    
+    columns = list(CSV_COLUMNS.values())
+    table = pacsv.read_csv(
+        csv_file,
+        read_options=pacsv.ReadOptions(use_threads=True, block_size=1 << 20),
+        # Quoted fields such as Notes may span lines, which the block splitter must respect
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        # Read every column as a string, with columns missing from the export as nulls
+        convert_options=pacsv.ConvertOptions(
+            column_types={column: pa.string() for column in columns},
+            include_columns=columns,
+            include_missing_columns=True,
+            strings_can_be_null=False
+        )
+    )
+    
+    if filter_actions is not None:
+        # Filter on the Arrow column before converting any rows to Python objects
+        value_set = pa.array(list(filter_actions), type=pa.string())
+        table = table.filter(pc.is_in(table[CSV_COLUMNS["action"]], value_set=value_set))
+    
+    transactions = []
+    for row in zip(*(pc.fill_null(table[column], "").to_pylist() for column in columns)):
+        fields = list(row)
+        fields[TOTAL_FIELD_INDEX] = parse_money(fields[TOTAL_FIELD_INDEX])
+        transactions.append(Trading212Transaction(*fields))
+    
+    return transactions
+
+# CSV parsers selectable with --engine
+CSV_READERS = {
+    "polars": _read_transactions_polars,
+    "pyarrow": _read_transactions_pyarrow,
+    "csv": _read_transactions_csv,
+}
+
+def filter_transactions(transactions: List[Trading212Transaction], selected_types: List[str]) -> List[Trading212Transaction]:
     """Filter transactions by selected transaction types"""
-    return [t for t in transactions if t["action"] in selected_types]
+    return [t for t in transactions if t.action in selected_types]
 
+@functools.lru_cache(maxsize=512)
 def format_category_name(category: str) -> str:
     """
     Format a category string from UPPERCASE_WITH_UNDERSCORES to Title Case.
@@ -357,124 +643,211 @@ def format_category_name(category: str) -> str:
     # Replace underscores with spaces and convert to title case
     return " ".join(word.capitalize() for word in category.replace("_", " ").lower().split())
 
-def prepare_ynab_transactions(transactions: List[Dict[str, Any]], account_id: str) -> List[Dict[str, Any]]:
+@functools.lru_cache(maxsize=4096)
+def format_merchant_name(merchant_name: str) -> str:
+    """
+    Format a merchant name by capitalizing each word.
+    
+    Args:
+        merchant_name (str): The raw merchant name from Trading 212.
+        
+    Returns:
+        str: The formatted merchant name.
+    """
+    return " ".join(word.capitalize() for word in merchant_name.split())
+
+def parse_transaction_date(timestamp: str) -> str:
+    """
+    Extract the date from a Trading 212 timestamp.
+    
+    Args:
+        timestamp (str): Timestamp such as "2024-01-31 09:15:00" or "2024-01-31 09:15:00.123".
+        
+    Returns:
+        str: The date in YYYY-MM-DD format.
+    """
+    # Trading 212 timestamps always start with the date, so slicing it off avoids parsing
+    if len(timestamp) >= 10 and timestamp[4] == '-' and timestamp[7] == '-':
+        return timestamp[:10]
+    
+    try:
+        # Fall back to ISO parsing for any other timestamp format
+        return datetime.datetime.fromisoformat(timestamp.replace(' ', 'T', 1)).strftime("%Y-%m-%d")
+    except ValueError:
+        # If parsing fails, just use the date part
+        print(f"Warning: Could not parse timestamp '{timestamp}', extracting date part only")
+        return timestamp.split()[0]
+
+# Labels used in the memo of market orders
+MARKET_ORDER_LABELS = {
+    Trading212Action.MARKET_BUY: "Purchase",
+    Trading212Action.MARKET_SELL: "Sale",
+}
+
+def _handle_deposit_or_withdrawal(t: Trading212Transaction, ynab_transaction: Dict[str, Any]) -> None:
+    """Use the action as the payee and the notes as the memo"""
+    ynab_transaction["payee_name"] = t.action
+    ynab_transaction["memo"] = t.notes if t.notes else None
+
+def _handle_interest(t: Trading212Transaction, ynab_transaction: Dict[str, Any]) -> None:
+    """Group cash and lending interest under an Interest payee, flagged purple"""
+    ynab_transaction["payee_name"] = "Interest"
+    ynab_transaction["memo"] = "Lending interest" if t.action == Trading212Action.LENDING_INTEREST else None
+    ynab_transaction["flag_color"] = "purple"
+    ynab_transaction["approved"] = t.action == Trading212Action.INTEREST_ON_CASH
+
+def _handle_cashback(t: Trading212Transaction, ynab_transaction: Dict[str, Any]) -> None:
+    """Label Trading 212 cashback, flagged green and pre-approved"""
+    ynab_transaction["payee_name"] = "Cashback"
+    ynab_transaction["memo"] = t.notes if t.notes else "Trading 212 Cashback"
+    ynab_transaction["flag_color"] = "green"
+    ynab_transaction["approved"] = True
+
+def _handle_dividend(t: Trading212Transaction, ynab_transaction: Dict[str, Any]) -> None:
+    """Name the stock as payee, with the share count and ticker in the memo"""
+    ynab_transaction["payee_name"] = f"Stock: {t.name}"
+    ynab_transaction["memo"] = f"Dividend - {t.shareCount}x {t.ticker} [{t.isin}]"
+
+def _handle_card_debit(t: Trading212Transaction, ynab_transaction: Dict[str, Any]) -> None:
+    """Use the merchant as payee, with its category and notes in the memo"""
+    # Format merchant name for cleaner display
+    raw_merchant_name = t.merchantName or "Unknown Merchant"
+    ynab_transaction["payee_name"] = format_merchant_name(raw_merchant_name)
+    
+    # Format category for cleaner display and add to memo
+    merchant_category = format_category_name(t.merchantCategory)
+    
+    # Add category hint in memo
+    memo = ""
+    if merchant_category:
+        memo += f"Category: {merchant_category}"
+    if t.notes:
+        memo += f" | {t.notes}"
+    
+    ynab_transaction["memo"] = memo.strip() if memo else None
+
+def _handle_card_credit(t: Trading212Transaction, ynab_transaction: Dict[str, Any]) -> None:
+    """Use the merchant as payee, with the credit type and category in the memo"""
+    # For refunds and credits
+    raw_merchant_name = t.merchantName or "Unknown Merchant"
+    ynab_transaction["payee_name"] = format_merchant_name(raw_merchant_name)
+    
+    # Format transaction type and category
+    merchant_type = t.notes or "Refund"  # Often "REFUND" or "PAYOUT"
+    merchant_category = format_category_name(t.merchantCategory)
+    
+    memo_parts = []
+    if merchant_type:
+        memo_parts.append(merchant_type.capitalize())
+    if merchant_category:
+        memo_parts.append(merchant_category)
+        
+    ynab_transaction["memo"] = " | ".join(memo_parts) if memo_parts else None
+
+def _handle_spending_cashback(t: Trading212Transaction, ynab_transaction: Dict[str, Any]) -> None:
+    """Label card spending cashback, flagged green and pre-approved"""
+    ynab_transaction["payee_name"] = "Cashback Rewards"
+    ynab_transaction["memo"] = "Spending cashback"
+    ynab_transaction["flag_color"] = "green"
+    ynab_transaction["approved"] = True
+
+def _handle_market_order(t: Trading212Transaction, ynab_transaction: Dict[str, Any]) -> None:
+    """Name the stock as payee, with the order details in the memo"""
+    ynab_transaction["payee_name"] = f"Stock: {t.name or t.ticker}"
+    
+    memo_parts = []
+    if t.ticker:
+        memo_parts.append(t.ticker)
+    if t.shareCount:
+        memo_parts.append(f"{t.shareCount} shares")
+    if t.pricePerShare and t.pricePerShareCurrency:
+        memo_parts.append(f"{t.pricePerShare} {t.pricePerShareCurrency}/share")
+    
+    ynab_transaction["memo"] = f"{MARKET_ORDER_LABELS[t.action]}: " + ", ".join(memo_parts)
+
+# Customizations of the basic YNAB transaction for each transaction type.
+# Types without a handler (e.g. currency conversions) are sent with the basic template only
+TRANSACTION_HANDLERS = {
+    Trading212Action.DEPOSIT: _handle_deposit_or_withdrawal,
+    Trading212Action.WITHDRAWAL: _handle_deposit_or_withdrawal,
+    Trading212Action.INTEREST_ON_CASH: _handle_interest,
+    Trading212Action.LENDING_INTEREST: _handle_interest,
+    Trading212Action.CASHBACK: _handle_cashback,
+    Trading212Action.DIVIDEND: _handle_dividend,
+    Trading212Action.CARD_DEBIT: _handle_card_debit,
+    Trading212Action.CARD_CREDIT: _handle_card_credit,
+    Trading212Action.SPENDING_CASHBACK: _handle_spending_cashback,
+    Trading212Action.MARKET_BUY: _handle_market_order,
+    Trading212Action.MARKET_SELL: _handle_market_order,
+}
+
+def prepare_ynab_transactions(transactions: List[Trading212Transaction], account_id: str) -> List[Dict[str, Any]]:
     """Convert Trading 212 transactions to YNAB format"""
     ynab_transactions = []
+    # Bind frequently used methods locally to avoid attribute lookups in the loop
+    append = ynab_transactions.append
+    get_handler = TRANSACTION_HANDLERS.get
     
     for t in transactions:
         # Handle timestamps with or without milliseconds
-        timestamp = t["timestamp"]
-        try:
-            # First try parsing with milliseconds
-            date = datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S.%f").strftime("%Y-%m-%d")
-        except ValueError:
-            try:
-                # Then try without milliseconds
-                date = datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d")
-            except ValueError:
-                # If both fail, just use the date part
-                print(f"Warning: Could not parse timestamp '{timestamp}', extracting date part only")
-                date = timestamp.split()[0]
+        date = parse_transaction_date(t.timestamp)
         
-        import_id = create_import_id(f"{t['timestamp']}:{t['id']}")
+        import_id = create_import_id(f"{t.timestamp}:{t.id}")
         
         # Basic transaction template
         ynab_transaction = {
             "account_id": account_id,
             "date": date,
             "cleared": "cleared",
-            "amount": t["total"],
+            "amount": t.total,
             "import_id": import_id
         }
         
         # Customize based on transaction type
-        if t["action"] == Trading212Action.DEPOSIT or t["action"] == Trading212Action.WITHDRAWAL:
-            ynab_transaction["payee_name"] = t["action"]
-            ynab_transaction["memo"] = t["notes"] if t["notes"] else None
-            
-        elif t["action"] == Trading212Action.INTEREST_ON_CASH or t["action"] == Trading212Action.LENDING_INTEREST:
-            ynab_transaction["payee_name"] = "Interest"
-            ynab_transaction["memo"] = "Lending interest" if t["action"] == Trading212Action.LENDING_INTEREST else None
-            ynab_transaction["flag_color"] = "purple"
-            ynab_transaction["approved"] = t["action"] == Trading212Action.INTEREST_ON_CASH
-
-        elif t["action"] == Trading212Action.CASHBACK:
-            ynab_transaction["payee_name"] = "Cashback"
-            ynab_transaction["memo"] = t["notes"] if t["notes"] else "Trading 212 Cashback"
-            ynab_transaction["flag_color"] = "green"
-            ynab_transaction["approved"] = True
-            
-        elif t["action"] == Trading212Action.DIVIDEND:
-            ynab_transaction["payee_name"] = f"Stock: {t['name']}"
-            ynab_transaction["memo"] = f"Dividend - {t['shareCount']}x {t['ticker']} [{t['isin']}]"
-            
-        elif t["action"] == Trading212Action.CARD_DEBIT:
-            # Format merchant name for cleaner display
-            raw_merchant_name = t["merchantName"] or "Unknown Merchant"
-            merchant_name = " ".join(word.capitalize() for word in raw_merchant_name.split())
-            ynab_transaction["payee_name"] = merchant_name
-            
-            # Format category for cleaner display and add to memo
-            merchant_category = format_category_name(t["merchantCategory"])
-            
-            # Add category hint in memo
-            memo = ""
-            if merchant_category:
-                memo += f"Category: {merchant_category}"
-            if t["notes"]:
-                memo += f" | {t['notes']}"
-            
-            ynab_transaction["memo"] = memo.strip() if memo else None
-            
-        elif t["action"] == Trading212Action.CARD_CREDIT:
-            # For refunds and credits
-            raw_merchant_name = t["merchantName"] or "Unknown Merchant"
-            merchant_name = " ".join(word.capitalize() for word in raw_merchant_name.split())
-            ynab_transaction["payee_name"] = merchant_name
-            
-            # Format transaction type and category
-            merchant_type = t["notes"] or "Refund"  # Often "REFUND" or "PAYOUT"
-            merchant_category = format_category_name(t["merchantCategory"])
-            
-            memo_parts = []
-            if merchant_type:
-                memo_parts.append(merchant_type.capitalize())
-            if merchant_category:
-                memo_parts.append(merchant_category)
-                
-            ynab_transaction["memo"] = " | ".join(memo_parts) if memo_parts else None
-            
-        elif t["action"] == Trading212Action.SPENDING_CASHBACK:
-            ynab_transaction["payee_name"] = "Cashback Rewards"
-            ynab_transaction["memo"] = "Spending cashback"
-            ynab_transaction["flag_color"] = "green"
-            ynab_transaction["approved"] = True
-            
-        elif t["action"] == Trading212Action.MARKET_BUY or t["action"] == Trading212Action.MARKET_SELL:
-            action_type = "Purchase" if t["action"] == Trading212Action.MARKET_BUY else "Sale"
-            ynab_transaction["payee_name"] = f"Stock: {t['name'] or t['ticker']}"
-            
-            memo_parts = []
-            if t["ticker"]:
-                memo_parts.append(t["ticker"])
-            if t["shareCount"]:
-                memo_parts.append(f"{t['shareCount']} shares")
-            if t["pricePerShare"] and t["pricePerShareCurrency"]:
-                memo_parts.append(f"{t['pricePerShare']} {t['pricePerShareCurrency']}/share")
-            
-            memo = f"{action_type}: " + ", ".join(memo_parts)
-            ynab_transaction["memo"] = memo
+        handler = get_handler(t.action)
+        if handler:
+            handler(t, ynab_transaction)
         
-        ynab_transactions.append(ynab_transaction)
+        append(ynab_transaction)
     
     return ynab_transactions
 
-def send_to_ynab(transactions: List[Dict[str, Any]], budget_id: str, ynab_token: str) -> bool:
+_ynab_session: Optional[requests.Session] = None
+
+def get_ynab_session() -> requests.Session:
+    """Get the shared YNAB session, creating it on first use"""
+    global _ynab_session
+    if _ynab_session is None:
+        _ynab_session = requests.Session()
+        _ynab_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0))
+    return _ynab_session
+
+def send_to_ynab(
+    transactions: List[Dict[str, Any]], 
+    budget_id: str, 
+    ynab_token: str,
+    session: Optional[requests.Session] = None
+) -> bool:
     """Send transactions to YNAB, relying on YNAB's deduplication"""
     if not transactions:
         print("No transactions to send")
         return True
     
+    # Drop repeated import IDs before sending - YNAB would only reject them as duplicates
+    seen_import_ids = set()
+    unique_transactions = []
+    for t in transactions:
+        import_id = t.get("import_id")
+        if import_id is not None:
+            if import_id in seen_import_ids:
+                continue
+            seen_import_ids.add(import_id)
+        unique_transactions.append(t)
+    
+    if len(unique_transactions) < len(transactions):
+        print(f"Note: Skipped {len(transactions) - len(unique_transactions)} transactions with repeated import IDs")
+    transactions = unique_transactions
+    
     print(f"Sending {len(transactions)} transactions to YNAB")
     
     headers = {
@@ -491,8 +864,16 @@ def send_to_ynab(transactions: List[Dict[str, Any]], budget_id: str, ynab_token:
     # Updated URL to use api.ynab.com instead of api.youneedabudget.com
     url = f"https://api.ynab.com/v1/budgets/{budget_id}/transactions"
     
+    session = session or get_ynab_session()
+    
+    # Serialize the body ourselves so orjson can be used when it's installed
+    if orjson is not None:
+        body = orjson.dumps(payload)
+    else:
+        body = json.dumps(payload, allow_nan=False).encode("utf-8")
+    
     try:
-        response = requests.post(url, headers=headers, json=payload)
+        response = session.post(url, headers=headers, data=body)
         
         # Print detailed error information for debugging
         if response.status_code >= 400:
@@ -518,16 +899,28 @@ def send_to_ynab(transactions: List[Dict[str, Any]], budget_id: str, ynab_token:
                 print(f"Raw response: {e.response.text}")
         return False
 
-def save_transactions_to_json(transactions: List[Dict[str, Any]], output_file: str) -> None:
-    """Save transactions to a JSON file"""
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(transactions, f, indent=2)
+def save_transactions_to_json(transactions: List[Trading212Transaction], output_file: str, pretty: bool = False) -> None:
+    """Save transactions to a JSON file, indented for reading if pretty is set"""
+    if orjson is not None:
+        with open(output_file, 'wb') as f:
+            # orjson serializes dataclasses natively
+            f.write(orjson.dumps(transactions, option=orjson.OPT_INDENT_2 if pretty else None))
+    else:
+        # json.dumps (unlike json.dump) can use the C encoder when not indenting
+        data = [t.to_dict() for t in transactions]
+        if pretty:
+            content = json.dumps(data, indent=2, ensure_ascii=False)
+        else:
+            content = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write(content)
     print(f"Saved {len(transactions)} transactions to {output_file}")
 
 def main():
     parser = argparse.ArgumentParser(description="Process Trading 212 transactions and send to YNAB")
     parser.add_argument("--csv", help="Path to Trading 212 CSV export file")
     parser.add_argument("--output", help="Output JSON file for processed transactions")
+    parser.add_argument("--pretty", action="store_true", help="Indent the JSON output file for readability")
     parser.add_argument("--filter", nargs="+", choices=[
         Trading212Action.DEPOSIT, 
         Trading212Action.WITHDRAWAL,
@@ -546,6 +939,10 @@ def main():
     parser.add_argument("--send", action="store_true", help="Send transactions to YNAB")
     parser.add_argument("--fetch", action="store_true", help="Fetch transactions from Trading 212 API instead of using local CSV")
     parser.add_argument("--demo", action="store_true", help="Use Trading 212 demo environment instead of live")
+    parser.add_argument("--reuse-export", action="store_true", 
+                        help="Download a finished export of the same date range from the last 15 minutes instead of requesting a new one")
+    parser.add_argument("--engine", choices=["auto", *CSV_READERS], default="auto", 
+                        help="CSV parser to use (default: polars if installed, otherwise the built-in csv module)")
     
     # Add date range options
     date_group = parser.add_mutually_exclusive_group()
@@ -588,21 +985,23 @@ def main():
             use_demo=args.demo,
             days=args.days,
             start_date=args.start_date,
-            save_raw_csv=args.save_raw_csv
+            save_raw_csv=args.save_raw_csv,
+            # Filter transactions while parsing if specified
+            filter_actions=set(args.filter) if args.filter else None,
+            engine=args.engine,
+            reuse_recent_export=args.reuse_export
         )
-        print(f"Loaded {len(transactions)} transactions")
+        if args.filter:
+            print(f"Loaded {len(transactions)} transactions matching the filter")
+        else:
+            print(f"Loaded {len(transactions)} transactions")
     except Exception as e:
         print(f"Error loading transactions: {e}")
         return
     
-    # Filter transactions if specified
-    if args.filter:
-        transactions = filter_transactions(transactions, args.filter)
-        print(f"Filtered to {len(transactions)} transactions")
-    
     # Save to JSON if output file specified
     if args.output:
-        save_transactions_to_json(transactions, args.output)
+        save_transactions_to_json(transactions, args.output, pretty=args.pretty)
     
     # Send to YNAB if requested
     if args.send: